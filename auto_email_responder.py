@@ -5,8 +5,9 @@ Auto Email Responder - Main script
 This script initializes and runs the automatic email responder system.
 """
 import os
-import time
 import logging
+import pathlib
+import threading
 
 from email_handler import EmailHandler
 from scheduler import setup_scheduler
@@ -19,15 +20,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ENV_PATH = pathlib.Path('.env')
+
 def load_env():
     """Simple .env file loader"""
-    if os.path.exists('.env'):
-        with open('.env') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
+    if not ENV_PATH.is_file():
+        return
+    for line in ENV_PATH.read_text().splitlines():
+        key, sep, value = line.strip().partition('=')
+        if sep and not key.startswith('#'):
+            os.environ[key.strip()] = value.strip()
 
 def main():
     """Main function to initialize and run the email responder."""
@@ -54,22 +56,19 @@ def main():
         return
     
     # Set up the scheduler
-    logger.info("Setting up scheduler to check emails every 10 minutes")
+    logger.info("Setting up IDLE watcher to check emails as they arrive")
+    # The watcher processes the inbox once as soon as it connects
     setup_scheduler(email_handler)
     
-    # Run once immediately
-    try:
-        email_handler.process_unread_emails()
-    except Exception as e:
-        logger.error(f"Error during initial email processing: {e}")
-    
     # Keep the script running
     logger.info("Auto Email Responder is now running. Press Ctrl+C to exit.")
     try:
-        while True:
-            time.sleep(1)
+        # Block without polling until interrupted
+        threading.Event().wait()
     except KeyboardInterrupt:
         logger.info("Auto Email Responder stopped by user")
+    finally:
+        email_handler.close()
 
 if __name__ == "__main__":
     print("Starting Auto Email Responder...")
@@ -9,146 +9,447 @@ This module handles all email-related operations including:
 - Sending automatic replies
 - Marking emails as read
 """
+import codecs
+import functools
 import imaplib
 import email
 import smtplib
 import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 from email.header import decode_header
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Gmail drops IMAP sessions that sit idle for ~30 minutes, so reconnect
+# proactively before reusing a connection that has been quiet this long.
+IMAP_MAX_IDLE_SECONDS = 25 * 60
+
+# Socket timeout for the long-lived connections, so a half-open connection
+# fails fast instead of blocking (and holding the locks) for minutes
+CONNECTION_TIMEOUT = 30
+
+# Cached SMTP connections idle longer than this are probed with NOOP before
+# reuse; within a burst of replies the probe is skipped
+SMTP_PROBE_AFTER_SECONDS = 60
+
+# Worker threads used to parse emails and send auto-replies concurrently
+REPLY_WORKERS = 8
+
+# Only the start of the body is needed to spot urgent keywords
+BODY_PREVIEW_BYTES = 4096
+
+# Headers needed for triage and the reply, plus the MIME headers required to
+# decode the body preview. PEEK leaves \Seen alone; _mark_as_read sets it.
+TRIAGE_FETCH = (
+    '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID MIME-VERSION '
+    'CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] '
+    f'BODY.PEEK[TEXT]<0.{BODY_PREVIEW_BYTES}>)'
+)
+
+# Locates the UID in a FETCH response
+UID_PATTERN = re.compile(rb'\bUID (\d+)')
+
+# Cheap subject-only fetch for unread mail the server search did not return
+SUBJECT_FETCH = '(BODY.PEEK[HEADER.FIELDS (SUBJECT)])'
+
+# Cheap first pass used to skip mail that was already processed
+MESSAGE_ID_FETCH = '(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])'
+
+# Processed Message-IDs older than this are pruned from the seen database
+SEEN_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+# How often the seen database is pruned while the process runs
+SEEN_PRUNE_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Charset names repeat across messages, so remember their codecs
+_lookup_codec = functools.lru_cache(maxsize=32)(codecs.lookup)
+
 class EmailHandler:
     """Handles all email operations for the Auto Email Responder."""
     
-    def __init__(self, email_address, password):
+    # Auto-reply body; only the subject and timestamp vary per reply
+    _REPLY_TEMPLATE = """
+Hello,
+
+This is an automatic response to your email regarding "{subject}".
+
+I have received your message marked as urgent and will address it as soon as possible.
+Please note that this is an automated reply sent at {when}.
+
+If your matter requires immediate attention, please contact me directly by phone.
+
+Best regards,
+Auto Email Responder
+"""
+    
+    def __init__(self, email_address, password, seen_db_path='seen.db'):
         """
         Initialize the EmailHandler with email credentials.
         
         Args:
             email_address (str): Gmail address
             password (str): App-specific password for Gmail
+            seen_db_path (str): SQLite file recording processed Message-IDs
         """
         self.email_address = email_address
         self.password = password
         self.imap_server = 'imap.gmail.com'
         self.smtp_server = 'smtp.gmail.com'
         self.smtp_port = 587
-        self.urgent_keywords = ['urgent', 'help', 'asap', 'emergency', 'important']
+        self.urgent_keywords = tuple(
+            keyword.lower() for keyword in ('urgent', 'help', 'asap', 'emergency', 'important')
+        )
+        
+        # Match all keywords in a single pass over the lowercased text
+        self._urgent_pattern = re.compile(
+            '|'.join(re.escape(keyword) for keyword in self.urgent_keywords)
+        )
+        
+        # Gmail search for unread mail mentioning any keyword. Gmail matches
+        # whole words and its index can lag behind new mail, so it misses
+        # substring hits such as "Helpdesk"; the subjects of the mail it does
+        # not return are checked locally before anything is marked read.
+        self._urgent_search = (
+            'X-GM-RAW', '"is:unread (' + ' OR '.join(self.urgent_keywords) + ')"'
+        )
+        
+        # Invariant headers of every auto-reply; see _new_reply()
+        self._reply_template = EmailMessage()
+        self._reply_template['From'] = self.email_address
+        
+        # Header-only parser used for triage; stops at the end of the headers
+        self._hparser = BytesHeaderParser()
+        
+        # Long-lived connections, reused across scheduler ticks
+        self._imap = None
+        self._imap_last_used = 0.0
+        self._imap_lock = threading.Lock()
+        
+        # Reply workers borrow SMTP connections from a shared pool of idle
+        # ones, so sporadic batches reuse a few warm sessions instead of each
+        # worker holding its own. Entries are (smtp, last_used) pairs, most
+        # recently used last.
+        self._smtp_idle = []
+        self._smtp_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=REPLY_WORKERS, thread_name_prefix='reply')
+        
+        # Message-IDs of processed mail, persisted so that mail left unread
+        # (or re-fetched after a restart) is not handled twice. Only used
+        # while holding self._imap_lock.
+        self._seen = sqlite3.connect(seen_db_path, check_same_thread=False)
+        with self._seen:
+            self._seen.execute(
+                'CREATE TABLE IF NOT EXISTS seen (mid TEXT PRIMARY KEY, seen_at REAL)'
+            )
+        self._prune_seen()
         
         # Test connection
         self._test_connection()
     
     def _test_connection(self):
-        """Test IMAP and SMTP connections to verify credentials."""
+        """Open the IMAP and SMTP connections to verify credentials."""
         # Test IMAP connection
         try:
-            imap = imaplib.IMAP4_SSL(self.imap_server)
-            imap.login(self.email_address, self.password)
-            imap.logout()
+            with self._imap_lock:
+                self._get_imap()
         except Exception as e:
             logger.error(f"IMAP connection test failed: {e}")
             raise ConnectionError(f"Failed to connect to IMAP server: {e}")
         
         # Test SMTP connection
         try:
-            smtp = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            smtp.ehlo()
-            smtp.starttls()
-            smtp.login(self.email_address, self.password)
-            smtp.quit()
+            # Keep the verified connection for the first reply
+            self._checkin_smtp(self._connect_to_smtp())
         except Exception as e:
             logger.error(f"SMTP connection test failed: {e}")
             raise ConnectionError(f"Failed to connect to SMTP server: {e}")
     
     def _connect_to_imap(self):
         """Connect to the IMAP server and select the inbox."""
-        imap = imaplib.IMAP4_SSL(self.imap_server)
+        imap = imaplib.IMAP4_SSL(self.imap_server, timeout=CONNECTION_TIMEOUT)
         imap.login(self.email_address, self.password)
         imap.select('INBOX')
         return imap
     
     def _connect_to_smtp(self):
         """Connect to the SMTP server for sending emails."""
-        smtp = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        smtp = smtplib.SMTP(
+            self.smtp_server, self.smtp_port, timeout=CONNECTION_TIMEOUT
+        )
         smtp.ehlo()
         smtp.starttls()
         smtp.login(self.email_address, self.password)
         return smtp
     
-    def _parse_email(self, raw_email):
+    def _get_imap(self):
+        """
+        Return the cached IMAP connection, reconnecting if it went stale.
+        
+        The caller must hold ``self._imap_lock``.
+        
+        Returns:
+            imaplib.IMAP4_SSL: Logged-in connection with INBOX selected
         """
-        Parse the raw email data into a structured format.
+        if self._imap is not None:
+            if time.monotonic() - self._imap_last_used > IMAP_MAX_IDLE_SECONDS:
+                logger.debug("IMAP connection idle for too long, reconnecting")
+                self._close_imap()
+            else:
+                try:
+                    self._imap.noop()
+                except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as e:
+                    logger.info(f"IMAP connection lost, reconnecting: {e}")
+                    self._close_imap()
+        
+        if self._imap is None:
+            self._imap = self._connect_to_imap()
+            logger.debug("Connected to IMAP server")
+        
+        self._imap_last_used = time.monotonic()
+        return self._imap
+    
+    def _checkout_smtp(self):
+        """
+        Borrow an SMTP connection from the pool, connecting if none is usable.
+        
+        A connection that has been idle for longer than SMTP_PROBE_AFTER_SECONDS
+        is probed with NOOP first, so replies within a burst skip the round trip.
+        
+        Returns:
+            smtplib.SMTP: Logged-in SMTP connection
+        """
+        with self._smtp_lock:
+            candidate = self._smtp_idle.pop() if self._smtp_idle else None
+        
+        if candidate is not None:
+            smtp, last_used = candidate
+            if time.monotonic() - last_used <= SMTP_PROBE_AFTER_SECONDS:
+                return smtp
+            try:
+                smtp.noop()
+                return smtp
+            except (smtplib.SMTPException, OSError) as e:
+                # The rest of the pool has been idle even longer; drop it too
+                logger.debug(f"Discarding stale SMTP connections: {e}")
+                with self._smtp_lock:
+                    stale, self._smtp_idle = self._smtp_idle, []
+                for conn in [smtp] + [conn for conn, _ in stale]:
+                    self._quit_smtp(conn)
+        
+        smtp = self._connect_to_smtp()
+        logger.debug("Connected to SMTP server")
+        return smtp
+    
+    def _checkin_smtp(self, smtp):
+        """Return a healthy SMTP connection to the pool."""
+        with self._smtp_lock:
+            self._smtp_idle.append((smtp, time.monotonic()))
+    
+    def _send_message(self, msg):
+        """
+        Send a message over a pooled SMTP connection.
+        
+        Failed sends are not retried: the server may already have accepted
+        the message, and a resend would deliver a duplicate reply.
+        
+        Args:
+            msg (EmailMessage): Message to send
+        """
+        smtp = self._checkout_smtp()
+        try:
+            smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._quit_smtp(smtp)
+            raise
+        except smtplib.SMTPException:
+            # e.g. a refused recipient; the session itself is still fine
+            self._checkin_smtp(smtp)
+            raise
+        except Exception:
+            # Socket and TLS errors (e.g. ssl.SSLEOFError) leave the
+            # connection unusable; don't return it to the pool
+            self._quit_smtp(smtp)
+            raise
+        self._checkin_smtp(smtp)
+    
+    def _close_imap(self):
+        """Log out of the cached IMAP connection, ignoring errors."""
+        imap, self._imap = self._imap, None
+        if imap is not None:
+            try:
+                imap.logout()
+            except Exception as e:
+                logger.debug(f"Error while logging out of IMAP: {e}")
+    
+    @staticmethod
+    def _quit_smtp(smtp):
+        """Quit an SMTP connection, ignoring errors."""
+        try:
+            smtp.quit()
+        except Exception as e:
+            logger.debug(f"Error while closing SMTP connection: {e}")
+    
+    def close(self):
+        """Stop the reply workers and close the cached IMAP and SMTP connections."""
+        self._pool.shutdown(wait=True)
+        with self._imap_lock:
+            self._close_imap()
+            self._seen.close()
+        with self._smtp_lock:
+            idle, self._smtp_idle = self._smtp_idle, []
+        for smtp, _ in idle:
+            self._quit_smtp(smtp)
+        logger.debug("Disconnected from mail servers")
+    
+    def _parse_headers(self, raw_email):
+        """
+        Parse only the headers of the raw email, stopping at the blank line.
         
         Args:
             raw_email: Raw email data from IMAP
             
         Returns:
-            dict: Structured email data with sender, subject, and body
+            dict: Email header data with sender, subject, and message_id
         """
-        msg = email.message_from_bytes(raw_email)
+        msg = self._hparser.parsebytes(raw_email)
         
         # Get sender
-        sender = msg.get('From', '')
+        sender = str(msg.get('From', ''))
         
         # Get subject
-        subject = msg.get('Subject', '')
-        if subject:
-            # Decode subject if needed
-            decoded_chunks = decode_header(subject)
+        # Raw 8-bit headers come back as Header objects; str() decodes them
+        subject = str(msg.get('Subject', ''))
+        if '=?' in subject:
+            # Decode RFC 2047 encoded words; plain subjects need no decoding
             subject = ''.join(
-                chunk.decode(encoding or 'utf-8') if isinstance(chunk, bytes) else chunk
-                for chunk, encoding in decoded_chunks
+                self._decode_chunk(chunk, encoding) if isinstance(chunk, bytes) else chunk
+                for chunk, encoding in decode_header(subject)
             )
         
-        # Get body
+        return {
+            'sender': sender,
+            'subject': subject,
+            'message_id': str(msg.get('Message-ID', '')).strip()
+        }
+    
+    @staticmethod
+    def _decode_chunk(chunk, encoding):
+        """
+        Decode one encoded-word chunk of a header, never raising.
+        
+        Undecodable bytes are replaced, and a chunk in an unknown charset is
+        kept as raw ASCII, so one malformed header cannot abort a batch.
+        
+        Args:
+            chunk (bytes): Chunk returned by decode_header
+            encoding (str): Its declared charset, or None
+            
+        Returns:
+            str: Decoded text
+        """
+        try:
+            return _lookup_codec(encoding or 'utf-8').decode(chunk, 'replace')[0]
+        except LookupError:
+            return chunk.decode('ascii', 'replace')
+    
+    def _parse_body(self, raw_email):
+        """
+        Parse the raw email and extract its plain-text body.
+        
+        Args:
+            raw_email: Raw email data from IMAP; may be the headers plus a
+                truncated body preview
+            
+        Returns:
+            str: Text of the first readable text/plain part
+        """
+        msg = email.message_from_bytes(raw_email)
+        
         body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition", ""))
-                
-                # Skip attachments
-                if "attachment" in content_disposition:
-                    continue
-                
-                # Get text content
-                if content_type == "text/plain":
-                    try:
-                        body_part = part.get_payload(decode=True)
-                        charset = part.get_content_charset() or 'utf-8'
-                        body += body_part.decode(charset)
-                    except Exception as e:
-                        logger.warning(f"Failed to decode email body part: {e}")
-        else:
-            # Not multipart, just get the payload
+        if msg.get_content_maintype() == 'text':
+            # Single-part text message, just get the payload
             try:
-                body = msg.get_payload(decode=True).decode(msg.get_content_charset() or 'utf-8')
+                codec = _lookup_codec(msg.get_content_charset() or 'utf-8')
+                body = codec.decode(msg.get_payload(decode=True), 'replace')[0]
             except Exception as e:
                 logger.warning(f"Failed to decode email body: {e}")
+        elif msg.is_multipart():
+            # The first text/plain part is enough for triage
+            part = self._first_text_part(msg)
+            if part is not None:
+                try:
+                    codec = _lookup_codec(part.get_content_charset() or 'utf-8')
+                    # The preview may cut a multi-byte character in half
+                    body = codec.decode(part.get_payload(decode=True), 'replace')[0]
+                except Exception as e:
+                    logger.warning(f"Failed to decode email body part: {e}")
         
-        return {
-            'sender': sender,
-            'subject': subject,
-            'body': body,
-            'message_id': msg.get('Message-ID', '')
-        }
+        return body
+    
+    @staticmethod
+    def _first_text_part(msg):
+        """
+        Find the first text/plain part of a multipart message that is not an attachment.
+        
+        Descends depth-first through each container's direct subparts, like
+        EmailMessage.iter_parts(), and stops at the first match instead of
+        visiting every node as walk() does.
+        
+        Args:
+            msg: Multipart message
+            
+        Returns:
+            The matching part, or None
+        """
+        for part in msg.get_payload():
+            if part.is_multipart():
+                found = EmailHandler._first_text_part(part)
+                if found is not None:
+                    return found
+            elif (part.get_content_type() == 'text/plain'
+                    and 'attachment' not in str(part.get('Content-Disposition', ''))):
+                return part
+        return None
     
     def _contains_urgent_keywords(self, text):
         """
         Check if the text contains any urgent keywords.
         
+        The text is lowercased once; the keywords are already lowercase.
+        
         Args:
             text (str): Text to check for keywords
             
         Returns:
             bool: True if any keyword is found, False otherwise
         """
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in self.urgent_keywords)
+        return self._urgent_pattern.search(text.lower()) is not None
+    
+    def _new_reply(self):
+        """
+        Create a new auto-reply message carrying the template's headers.
+        
+        The headers are copied into the new message's own header list with
+        set_raw, which reuses the already-parsed values, so the shared
+        template is never modified.
+        
+        Returns:
+            EmailMessage: Message with the invariant headers set
+        """
+        msg = EmailMessage()
+        for name, value in self._reply_template.raw_items():
+            msg.set_raw(name, value)
+        return msg
     
-    def _send_auto_reply(self, to_email, subject, original_subject):
+    def _send_auto_reply(self, to_email, subject, original_subject, current_time):
         """
         Send an automatic reply to the given email address.
         
@@ -156,136 +457,296 @@ class EmailHandler:
             to_email (str): Recipient email address
             subject (str): Subject of the original email
             original_subject (str): Original subject for the reply
+            current_time (str): Timestamp quoted in the reply body
         """
         # Create the email message
-        msg = EmailMessage()
-        msg['From'] = self.email_address
+        msg = self._new_reply()
         msg['To'] = to_email
         msg['Subject'] = f"Re: {original_subject}"
         
-        # Current time
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         # Email body
-        body = f"""
-Hello,
-
-This is an automatic response to your email regarding "{subject}".
-
-I have received your message marked as urgent and will address it as soon as possible.
-Please note that this is an automated reply sent at {current_time}.
-
-If your matter requires immediate attention, please contact me directly by phone.
-
-Best regards,
-Auto Email Responder
-        """
-        msg.set_content(body)
+        msg.set_content(self._REPLY_TEMPLATE.format(subject=subject, when=current_time))
         
         # Send the email
         try:
-            smtp = self._connect_to_smtp()
-            smtp.send_message(msg)
-            smtp.quit()
+            self._send_message(msg)
             logger.info(f"Auto-reply sent to {to_email}")
             return True
         except Exception as e:
             logger.error(f"Failed to send auto-reply: {e}")
             return False
     
+    @staticmethod
+    def _iter_fetched(data):
+        """
+        Iterate over the messages returned by a multi-message UID FETCH.
+        
+        Args:
+            data: Response data from ``imap.uid('FETCH', ...)``
+            
+        Yields:
+            tuple: (uid, raw_email) for every fetched message
+        """
+        # Each message starts with (b'SEQ (UID n BODY[...] {n}', payload).
+        # Further literals of the same message follow as (b' BODY[...] {n}', ...)
+        # and its remaining items as plain bytes such as b')' or b' UID n)'.
+        # The UID may appear in any of them.
+        messages = []
+        for item in data:
+            label = item[0] if isinstance(item, tuple) else item
+            if label[:1].isdigit():
+                if not isinstance(item, tuple):
+                    # Unsolicited FETCH response without literals, e.g. a flag change
+                    continue
+                messages.append(([], []))
+            elif not messages:
+                continue
+            meta, parts = messages[-1]
+            meta.append(label)
+            if isinstance(item, tuple):
+                parts.append(item)
+        
+        for meta, parts in messages:
+            match = UID_PATTERN.search(b' '.join(meta))
+            if match:
+                yield match.group(1), EmailHandler._join_sections(parts)
+    
+    @staticmethod
+    def _join_sections(parts):
+        """Join fetched sections into one message, headers first."""
+        parts.sort(key=lambda part: b'HEADER' not in part[0])
+        return b''.join(payload for _, payload in parts)
+    
+    def _fetch_subjects(self, imap, email_ids):
+        """
+        Fetch just the Subject header of the given emails.
+        
+        Args:
+            imap: IMAP connection
+            email_ids (list): UIDs of the emails to look up
+            
+        Returns:
+            list: (uid, subject) pairs; empty if the fetch failed. Emails
+                whose header could not be parsed are left out, so they stay
+                unread.
+        """
+        status, data = imap.uid('FETCH', b','.join(email_ids), SUBJECT_FETCH)
+        if status != 'OK':
+            logger.warning("Failed to fetch subjects")
+            return []
+        
+        subjects = []
+        for email_id, raw_header in self._iter_fetched(data):
+            try:
+                subjects.append((email_id, self._parse_headers(raw_header)['subject']))
+            except Exception as e:
+                logger.warning(f"Failed to parse subject of email {email_id}: {e}")
+        return subjects
+    
+    def _fetch_message_ids(self, imap, email_ids):
+        """
+        Fetch just the Message-ID header of the given emails.
+        
+        Args:
+            imap: IMAP connection
+            email_ids (list): UIDs of the emails to look up
+            
+        Returns:
+            dict: Message-ID for each UID that has one
+        """
+        status, data = imap.uid('FETCH', b','.join(email_ids), MESSAGE_ID_FETCH)
+        if status != 'OK':
+            logger.warning("Failed to fetch Message-IDs")
+            return {}
+        
+        message_ids = {}
+        for email_id, raw_header in self._iter_fetched(data):
+            message_id = self._parse_headers(raw_header)['message_id']
+            if message_id:
+                message_ids[email_id] = message_id
+        return message_ids
+    
+    def _is_seen(self, message_id):
+        """Return True if the email with this Message-ID was already processed."""
+        return message_id is not None and self._seen.execute(
+            'SELECT 1 FROM seen WHERE mid = ?', (message_id,)
+        ).fetchone() is not None
+    
+    def _remember_seen(self, message_ids):
+        """Record the given Message-IDs as processed, pruning old ones daily."""
+        now = time.time()
+        with self._seen:
+            self._seen.executemany(
+                'INSERT OR IGNORE INTO seen (mid, seen_at) VALUES (?, ?)',
+                ((message_id, now) for message_id in message_ids)
+            )
+        
+        if time.monotonic() - self._seen_pruned_at > SEEN_PRUNE_INTERVAL_SECONDS:
+            self._prune_seen()
+    
+    def _prune_seen(self):
+        """Delete Message-IDs older than SEEN_RETENTION_SECONDS."""
+        with self._seen:
+            self._seen.execute(
+                'DELETE FROM seen WHERE seen_at < ?', (time.time() - SEEN_RETENTION_SECONDS,)
+            )
+        self._seen_pruned_at = time.monotonic()
+    
     def _mark_as_read(self, imap, email_id):
         """
         Mark an email as read.
         
         Args:
             imap: IMAP connection
-            email_id: ID of the email to mark as read
+            email_id: UID of the email to mark as read, or a comma-separated
+                set of UIDs to mark them all in one command
         """
         try:
-            imap.store(email_id, '+FLAGS', '\\Seen')
+            imap.uid('STORE', email_id, '+FLAGS', '\\Seen')
             logger.debug(f"Marked email {email_id} as read")
             return True
         except Exception as e:
             logger.error(f"Failed to mark email as read: {e}")
             return False
     
+    def _process_email(self, raw_email, batch_time):
+        """
+        Check a fetched email for urgent keywords and reply if needed.
+        
+        Runs on a reply worker thread and must not touch the IMAP connection.
+        
+        Args:
+            raw_email: Raw email data from IMAP
+            batch_time (str): Timestamp of the current batch, used in replies
+        """
+        # Parse the headers; the body is only needed if the subject is not urgent
+        email_data = self._parse_headers(raw_email)
+        sender = email_data['sender']
+        subject = email_data['subject']
+        
+        logger.info(f"Processing email from {sender} with subject: {subject}")
+        
+        # Check if the email contains urgent keywords
+        if (self._contains_urgent_keywords(subject)
+                or self._contains_urgent_keywords(self._parse_body(raw_email))):
+            logger.info(f"Urgent keywords found in email from {sender}")
+            
+            from_email = parseaddr(sender)[1] or sender
+            
+            # Send auto-reply
+            if self._send_auto_reply(from_email, subject, subject, batch_time):
+                logger.info(f"Auto-reply sent to {from_email}")
+                # Log to console
+                print(f"Replied to: {sender} - Subject: {subject}")
+            else:
+                logger.warning(f"Failed to send auto-reply to {from_email}")
+    
     def process_unread_emails(self):
         """
         Process all unread emails in the inbox.
         
         This method:
-        1. Connects to the IMAP server
+        1. Reuses (or re-establishes) the IMAP connection
         2. Searches for unread emails
-        3. Processes each email
-        4. Sends auto-replies if needed
+        3. Asks the server which of them mention urgent keywords, and checks
+           the subjects of the rest locally
+        4. Fetches and checks only the candidates, sending auto-replies if needed
         5. Marks emails as read
         """
-        try:
-            imap = self._connect_to_imap()
-            logger.debug("Connected to IMAP server")
-            
-            # Search for unread emails
-            status, messages = imap.search(None, 'UNSEEN')
-            
-            if status != 'OK':
-                logger.warning("Failed to search for unread emails")
-                imap.logout()
-                return
-            
-            # Get the list of email IDs
-            email_ids = messages[0].split()
-            
-            if not email_ids:
-                logger.info("No unread emails found")
-                imap.logout()
-                return
-            
-            logger.info(f"Found {len(email_ids)} unread email(s)")
-            
-            # Process each email
-            for email_id in email_ids:
-                try:
-                    # Fetch the email
-                    status, data = imap.fetch(email_id, '(RFC822)')
-                    
-                    if status != 'OK':
-                        logger.warning(f"Failed to fetch email {email_id}")
-                        continue
-                    
-                    # Parse the email
-                    email_data = self._parse_email(data[0][1])
-                    sender = email_data['sender']
-                    subject = email_data['subject']
-                    body = email_data['body']
+        with self._imap_lock:
+            try:
+                imap = self._get_imap()
+                
+                # Search for unread emails. UIDs are used throughout so that
+                # expunges by other clients cannot renumber messages under us.
+                status, messages = imap.uid('SEARCH', None, 'UNSEEN')
+                
+                if status != 'OK':
+                    logger.warning("Failed to search for unread emails")
+                    return
+                
+                # Get the list of email UIDs
+                email_ids = messages[0].split()
+                
+                if not email_ids:
+                    logger.info("No unread emails found")
+                    return
+                
+                # Let the server pick out urgent candidates so that ordinary
+                # mail is never downloaded in full
+                status, messages = imap.uid('SEARCH', None, *self._urgent_search)
+                
+                if status != 'OK':
+                    logger.warning("Failed to search for urgent emails")
+                    return
+                
+                unread_ids = set(email_ids)
+                urgent_ids = [i for i in messages[0].split() if i in unread_ids]
+                urgent_set = set(urgent_ids)
+                
+                # The server search can miss mail (whole-word matching, index
+                # lag), so check the subjects of everything else locally. Only
+                # mail whose subject was actually checked is marked read.
+                processed_ids = []
+                other_ids = [i for i in email_ids if i not in urgent_set]
+                if other_ids:
+                    for email_id, subject in self._fetch_subjects(imap, other_ids):
+                        if self._contains_urgent_keywords(subject):
+                            urgent_ids.append(email_id)
+                        else:
+                            processed_ids.append(email_id)
+                
+                logger.info(f"Found {len(email_ids)} unread email(s), "
+                            f"{len(urgent_ids)} possibly urgent")
+                
+                if urgent_ids:
+                    # Skip candidates that were already handled, e.g. before a restart
+                    message_ids = self._fetch_message_ids(imap, urgent_ids)
+                    new_ids = []
+                    for email_id in urgent_ids:
+                        if self._is_seen(message_ids.get(email_id)):
+                            processed_ids.append(email_id)
+                        else:
+                            new_ids.append(email_id)
                     
-                    logger.info(f"Processing email from {sender} with subject: {subject}")
+                    if len(new_ids) < len(urgent_ids):
+                        logger.info(f"Skipping {len(urgent_ids) - len(new_ids)} "
+                                    "already processed email(s)")
+                    urgent_ids = new_ids
+                
+                if urgent_ids:
+                    # Fetch headers and a body preview for all candidates in a single round trip
+                    status, data = imap.uid('FETCH', b','.join(urgent_ids), TRIAGE_FETCH)
                     
-                    # Check if the email contains urgent keywords
-                    if self._contains_urgent_keywords(subject) or self._contains_urgent_keywords(body):
-                        logger.info(f"Urgent keywords found in email from {sender}")
-                        
-                        # Extract email address from sender
-                        from_email = sender
-                        if '<' in sender and '>' in sender:
-                            from_email = sender.split('<')[1].split('>')[0]
-                        
-                        # Send auto-reply
-                        if self._send_auto_reply(from_email, subject, subject):
-                            logger.info(f"Auto-reply sent to {from_email}")
-                            # Log to console
-                            print(f"Replied to: {sender} - Subject: {subject}")
-                        else:
-                            logger.warning(f"Failed to send auto-reply to {from_email}")
+                    if status != 'OK':
+                        logger.warning("Failed to fetch urgent emails")
+                        return
                     
-                    # Mark the email as read
-                    self._mark_as_read(imap, email_id)
+                    # Process the emails concurrently; IMAP stays on this thread
+                    batch_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    futures = {
+                        self._pool.submit(self._process_email, raw_email, batch_time): email_id
+                        for email_id, raw_email in self._iter_fetched(data)
+                    }
+                    done_ids = []
+                    for future, email_id in futures.items():
+                        try:
+                            future.result()
+                            done_ids.append(email_id)
+                        except Exception as e:
+                            logger.error(f"Error processing email {email_id}: {e}")
                     
-                except Exception as e:
-                    logger.error(f"Error processing email {email_id}: {e}")
-            
-            # Logout from IMAP
-            imap.logout()
-            logger.debug("Disconnected from IMAP server")
-            
-        except Exception as e:
-            logger.error(f"Error during email processing: {e}")
\ No newline at end of file
+                    processed_ids.extend(done_ids)
+                    self._remember_seen(
+                        message_ids[email_id] for email_id in done_ids if email_id in message_ids
+                    )
+                
+                # Mark the processed emails as read in one command
+                if processed_ids:
+                    self._mark_as_read(imap, b','.join(processed_ids))
+                
+            except Exception as e:
+                logger.error(f"Error during email processing: {e}")
+                if isinstance(e, (imaplib.IMAP4.abort, OSError)):
+                    # Connection is unusable; rebuild it on the next run
+                    self._close_imap()
@@ -2,48 +2,142 @@
 """
 Scheduler Module
 
-This module handles the scheduling of email checking at regular intervals.
+This module watches the inbox with IMAP IDLE (RFC 2177) and triggers email
+processing whenever the server reports new mail. While the IDLE connection is
+down, a fallback poller checks the inbox at a fixed interval instead.
 """
-import schedule
+import sched
 import time
 import logging
 import threading
 
+from imapclient import IMAPClient
+
+from email_handler import CONNECTION_TIMEOUT
+
 logger = logging.getLogger(__name__)
 
+# Gmail terminates IDLE commands after 30 minutes; re-issue them before that.
+IDLE_TIMEOUT = 29 * 60
+
+# Delay before reconnecting after the IDLE connection fails
+RECONNECT_DELAY = 30
+
+# Polling interval used while the IDLE connection is down
+POLL_INTERVAL = 10 * 60
+
 def setup_scheduler(email_handler):
     """
-    Set up a scheduler to check emails at regular intervals.
-    
+    Set up an IMAP IDLE watcher that processes emails as they arrive.
+
     Args:
         email_handler: EmailHandler instance to process emails
     """
-    def run_threaded(job_func):
-        """Run the job function in a separate thread."""
-        job_thread = threading.Thread(target=job_func)
-        job_thread.daemon = True
-        job_thread.start()
-    
     def check_emails():
-        """Function to check emails that will be scheduled."""
-        logger.info("Scheduled check: Checking for new emails...")
+        """Function to check emails when the server reports new mail."""
+        logger.info("New mail notification: Checking for new emails...")
         try:
             email_handler.process_unread_emails()
         except Exception as e:
-            logger.error(f"Error during scheduled email check: {e}")
-    
-    # Schedule the job to run every 10 minutes
-    schedule.every(10).minutes.do(run_threaded, check_emails)
-    
-    # Start the scheduler in a separate thread
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
-    
-    logger.info("Scheduler started. Emails will be checked every 10 minutes.")
-
-def run_scheduler():
-    """Run the scheduler continuously."""
+            logger.error(f"Error during email check: {e}")
+
+    # Set while the IDLE connection is up; the poller covers the gaps
+    idle_up = threading.Event()
+
+    # Start the IDLE watcher in a separate thread
+    idle_thread = threading.Thread(target=run_idle, args=(email_handler, check_emails, idle_up))
+    idle_thread.daemon = True
+    idle_thread.start()
+
+    # Start the fallback poller in another thread
+    poll_thread = threading.Thread(target=run_polling, args=(check_emails, idle_up))
+    poll_thread.daemon = True
+    poll_thread.start()
+
+    logger.info("IDLE watcher started. Emails will be checked as soon as they arrive.")
+
+def run_idle(email_handler, on_new_mail, idle_up):
+    """
+    Keep an IDLE connection open, reconnecting whenever it drops.
+
+    Args:
+        email_handler: EmailHandler instance providing the credentials
+        on_new_mail: Callable invoked when new mail is reported
+        idle_up: Event set while the IDLE connection is established
+    """
     while True:
-        schedule.run_pending()
-        time.sleep(1)
\ No newline at end of file
+        try:
+            # The socket timeout makes a half-open connection fail instead of
+            # hanging in idle_done()/noop(); idle_check() sets its own timeout
+            client = IMAPClient(email_handler.imap_server, ssl=True,
+                                timeout=CONNECTION_TIMEOUT)
+            try:
+                client.login(email_handler.email_address, email_handler.password)
+                client.select_folder('INBOX', readonly=True)
+                logger.debug("IDLE connection established")
+                idle_up.set()
+
+                # Catch up on anything that arrived while disconnected
+                on_new_mail()
+                idle_loop(client, on_new_mail)
+            finally:
+                idle_up.clear()
+                try:
+                    client.logout()
+                except Exception:
+                    pass
+        except Exception as e:
+            logger.error(f"IDLE connection failed: {e}")
+            time.sleep(RECONNECT_DELAY)
+
+def run_polling(on_new_mail, idle_up):
+    """
+    Invoke on_new_mail every POLL_INTERVAL seconds while IDLE is down.
+
+    Covers outages of the IDLE connection, e.g. repeated reconnect failures,
+    during which no new-mail notifications arrive. Runs are scheduled at
+    absolute times on the monotonic clock, so the thread sleeps until each one
+    is due and processing time does not cause drift.
+
+    Args:
+        on_new_mail: Callable invoked on every tick while IDLE is down
+        idle_up: Event set while the IDLE connection is established
+    """
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+
+    def tick(due):
+        if not idle_up.is_set():
+            logger.info("IDLE connection is down, polling for new mail")
+            on_new_mail()
+        scheduler.enterabs(due + POLL_INTERVAL, 1, tick, (due + POLL_INTERVAL,))
+
+    first_run = time.monotonic() + POLL_INTERVAL
+    scheduler.enterabs(first_run, 1, tick, (first_run,))
+    scheduler.run()
+
+def idle_loop(client, on_new_mail):
+    """
+    Wait for EXISTS/RECENT responses and dispatch them until the connection fails.
+
+    Args:
+        client: Logged-in IMAPClient with INBOX selected
+        on_new_mail: Callable invoked when new mail is reported
+    """
+    while True:
+        client.idle()
+        try:
+            responses = client.idle_check(timeout=IDLE_TIMEOUT)
+        finally:
+            _, done_responses = client.idle_done()
+        responses += done_responses
+
+        if not has_new_mail(responses):
+            # Timed out without news; keep the session alive before re-entering IDLE
+            _, responses = client.noop()
+        if has_new_mail(responses):
+            on_new_mail()
+
+def has_new_mail(responses):
+    """Return True if any untagged response announces new messages."""
+    return any(len(response) > 1 and response[1] in (b'EXISTS', b'RECENT')
+               for response in responses)
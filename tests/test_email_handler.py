@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Tests for EmailHandler reply construction and inbox triage."""
+import unittest
+from unittest import mock
+
+from email_handler import (
+    EmailHandler, MESSAGE_ID_FETCH, SUBJECT_FETCH, TRIAGE_FETCH
+)
+
+
+class AutoReplyTemplateTest(unittest.TestCase):
+    """Replies must not leak headers into the shared reply template."""
+
+    def setUp(self):
+        with mock.patch('imaplib.IMAP4_SSL'), mock.patch('smtplib.SMTP') as smtp_class:
+            self.handler = EmailHandler('me@gmail.com', 'password', seen_db_path=':memory:')
+        self.smtp = smtp_class.return_value
+        self.addCleanup(self.handler.close)
+
+    def test_template_keeps_only_from_after_replies(self):
+        self.assertTrue(self.handler._send_auto_reply('a@example.com', 'Help', 'Help', 'now'))
+        self.assertTrue(self.handler._send_auto_reply('b@example.com', 'ASAP', 'ASAP', 'now'))
+
+        self.assertEqual(self.handler._reply_template.items(), [('From', 'me@gmail.com')])
+
+        sent = [call.args[0] for call in self.smtp.send_message.call_args_list]
+        self.assertEqual(len(sent), 2)
+        for msg, to_email, subject in zip(sent, ('a@example.com', 'b@example.com'),
+                                          ('Re: Help', 'Re: ASAP')):
+            self.assertEqual(msg.get_all('From'), ['me@gmail.com'])
+            self.assertEqual(msg.get_all('To'), [to_email])
+            self.assertEqual(msg.get_all('Subject'), [subject])
+
+
+class IterFetchedTest(unittest.TestCase):
+    """_iter_fetched must cope with every shape of imaplib FETCH response."""
+
+    def fetched(self, data):
+        return list(EmailHandler._iter_fetched(data))
+
+    def test_uid_before_literal(self):
+        data = [(b'1 (UID 11 BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: a'), b')',
+                (b'2 (UID 12 BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: b'), b')']
+        self.assertEqual(self.fetched(data), [(b'11', b'Subject: a'), (b'12', b'Subject: b')])
+
+    def test_uid_after_literal(self):
+        data = [(b'1 (BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: a'), b' UID 11)']
+        self.assertEqual(self.fetched(data), [(b'11', b'Subject: a')])
+
+    def test_extra_section_literals_are_joined_headers_first(self):
+        data = [(b'1 (UID 11 BODY[TEXT]<0> {4}', b'body'),
+                (b' BODY[HEADER.FIELDS (SUBJECT)] {11}', b'Subject: a\n'), b')']
+        self.assertEqual(self.fetched(data), [(b'11', b'Subject: a\nbody')])
+
+    def test_unsolicited_flag_only_response_is_skipped(self):
+        data = [b'3 (FLAGS (\\Seen))',
+                (b'1 (UID 11 BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: a'), b')',
+                b'4 (UID 14 FLAGS (\\Seen))']
+        self.assertEqual(self.fetched(data), [(b'11', b'Subject: a')])
+
+    def test_section_without_literal(self):
+        data = [(b'1 (UID 11 BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: a'),
+                b' BODY[TEXT]<0> "")']
+        self.assertEqual(self.fetched(data), [(b'11', b'Subject: a')])
+
+    def test_message_without_uid_is_skipped(self):
+        data = [(b'1 (BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject: a'), b')']
+        self.assertEqual(self.fetched(data), [])
+
+
+class ProcessUnreadEmailsTest(unittest.TestCase):
+    """One pass over the inbox against a fake IMAP connection."""
+
+    def setUp(self):
+        with mock.patch('imaplib.IMAP4_SSL') as imap_class, \
+                mock.patch('smtplib.SMTP') as smtp_class:
+            self.handler = EmailHandler('me@gmail.com', 'password', seen_db_path=':memory:')
+        self.imap = imap_class.return_value
+        self.imap.uid.side_effect = self.fake_uid
+        self.smtp = smtp_class.return_value
+        self.addCleanup(self.handler.close)
+        self.stores = []
+
+    @staticmethod
+    def literal(uid, section, payload):
+        return (b'1 (UID ' + uid + b' ' + section + b' {%d}' % len(payload), payload)
+
+    def fake_uid(self, command, *args):
+        # process_unread_emails logs and swallows errors, so an assertion
+        # failing in here shows up as a missing STORE
+        if command == 'SEARCH':
+            if args[1:] == ('UNSEEN',):
+                return 'OK', [b'1 2 3 4 5']
+            self.assertEqual(args[1], 'X-GM-RAW')
+            return 'OK', [b'1 2 9']
+
+        if command == 'STORE':
+            self.stores.append(args)
+            return 'OK', [b'']
+
+        self.assertEqual(command, 'FETCH')
+        uids, query = args
+        if query == SUBJECT_FETCH:
+            self.assertEqual(uids, b'3,4,5')
+            section = b'BODY[HEADER.FIELDS (SUBJECT)]'
+            return 'OK', [
+                self.literal(b'3', section, b'Subject: Helpdesk ticket\r\n\r\n'), b')',
+                self.literal(b'4', section, b'Subject: Lunch\r\n\r\n'), b')',
+                # Malformed encoded word; must not abort the batch
+                self.literal(b'5', section, b'Subject: =?utf-8?b?/w==?=\r\n\r\n'), b')',
+            ]
+        if query == MESSAGE_ID_FETCH:
+            self.assertEqual(uids, b'1,2,3')
+            data = []
+            for uid in (b'1', b'2', b'3'):
+                data += [self.literal(uid, b'BODY[HEADER.FIELDS (MESSAGE-ID)]',
+                                      b'Message-ID: <%s@x>\r\n\r\n' % uid), b')']
+            return 'OK', data
+        self.assertEqual(query, TRIAGE_FETCH)
+        self.assertEqual(uids, b'2,3')
+        return 'OK', [
+            self.literal(b'2', b'BODY[HEADER.FIELDS (FROM SUBJECT)]',
+                         b'From: Ann <ann@example.com>\r\nSubject: Hi\r\n\r\n'),
+            (b' BODY[TEXT]<0> {20}', b'this is urgent\r\nok\r\n'), b')',
+            self.literal(b'3', b'BODY[HEADER.FIELDS (FROM SUBJECT)]',
+                         b'From: bob@example.com\r\nSubject: Helpdesk ticket\r\n\r\n'),
+            b' BODY[TEXT]<0> "")',
+        ]
+
+    def test_triage_replies_and_marks_everything_read_once(self):
+        self.handler._remember_seen(['<1@x>'])
+
+        self.handler.process_unread_emails()
+
+        sent = [call.args[0]['To'] for call in self.smtp.send_message.call_args_list]
+        self.assertEqual(sorted(sent), ['ann@example.com', 'bob@example.com'])
+
+        self.assertEqual(len(self.stores), 1)
+        uids, flags, flag = self.stores[0]
+        self.assertEqual(sorted(uids.split(b',')), [b'1', b'2', b'3', b'4', b'5'])
+        self.assertEqual((flags, flag), ('+FLAGS', '\\Seen'))
+
+        for message_id in ('<2@x>', '<3@x>'):
+            self.assertTrue(self.handler._is_seen(message_id))
+
+
+if __name__ == '__main__':
+    unittest.main()